@@ -1,32 +1,118 @@
 import asyncio
+import functools
 import itertools
-from typing import Optional, Union
+import socket
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar, Union
 
 from kubernetes import client, config  # type: ignore
-from kubernetes.client.models import (
-    V1Container,
-    V1DaemonSet,
-    V1DaemonSetList,
-    V1Deployment,
-    V1DeploymentList,
-    V1JobList,
-    V1LabelSelector,
-    V1PodList,
-    V1StatefulSet,
-    V1StatefulSetList,
-)
+from kubernetes.client.api_client import ApiClient
+from kubernetes.client.models import V1Container, V1DaemonSet, V1Deployment, V1Job, V1Pod, V1ReplicaSet, V1StatefulSet
+from urllib3.connection import HTTPConnection
 
 from robusta_krr.core.models.objects import K8sObjectData
 from robusta_krr.core.models.result import ResourceAllocations
 from robusta_krr.utils.configurable import Configurable
 
+_T = TypeVar("_T")
+_ItemT = TypeVar("_ItemT", V1Deployment, V1StatefulSet, V1DaemonSet, V1Job, V1ReplicaSet, V1Pod)
+
+
+def _keepalive_socket_options() -> list[tuple[int, int, int]]:
+    options = [*HTTPConnection.default_socket_options, (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+    # NOTE: Those are not available on every platform (e.g. TCP_KEEPIDLE is missing on macOS)
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 30))
+
+    return options
+
+
+def _create_api_client(cluster: Optional[str], pool_maxsize: int) -> ApiClient:
+    if cluster is None:
+        configuration = client.Configuration.get_default_copy()
+    else:
+        configuration = client.Configuration()
+        config.load_kube_config(context=cluster, client_configuration=configuration)
+
+    # NOTE: Every executor worker might hold a connection, so the pool should not be smaller than that,
+    # otherwise urllib3 discards the extra connections and the parallel requests reconnect each time
+    configuration.connection_pool_maxsize = max(configuration.connection_pool_maxsize, pool_maxsize)
+    api_client = ApiClient(configuration=configuration)
+
+    # NOTE: Idle connections are often dropped by load balancers in front of the API server,
+    # TCP keepalive lets the pool reuse them instead of doing a new TLS handshake for each request
+    api_client.rest_client.pool_manager.connection_pool_kw["socket_options"] = _keepalive_socket_options()
+    return api_client
+
+
+_api_clients: dict[Optional[str], ApiClient] = {}
+
+
+def _close_api_client(api_client: ApiClient) -> None:
+    api_client.rest_client.pool_manager.clear()
+    api_client.close()
+
+
+def get_api_client(cluster: Optional[str], *, pool_maxsize: int) -> ApiClient:
+    """Get an API client for the cluster, creating it on the first use.
+
+    Clients are cached by the kubeconfig context until close_api_clients() is called,
+    so the kubernetes and the Prometheus loaders of a cluster share one connection pool during a run.
+
+    Args:
+        cluster: The kubeconfig context, or None for the default configuration.
+        pool_maxsize: The minimal size of the connection pool.
+
+    Returns:
+        The API client.
+    """
+
+    if cluster not in _api_clients:
+        api_client = _create_api_client(cluster, pool_maxsize)
+        # NOTE: Another thread might have created a client for the same cluster in the meantime,
+        # in that case the cached one is used and the new one is closed
+        if _api_clients.setdefault(cluster, api_client) is not api_client:
+            _close_api_client(api_client)
+
+    return _api_clients[cluster]
+
+
+def close_api_clients() -> None:
+    """Close all the cached API clients and their connection pools."""
+
+    while _api_clients:
+        _, api_client = _api_clients.popitem()
+        _close_api_client(api_client)
+
 
 class ClusterLoader(Configurable):
-    def __init__(self, cluster: Optional[str], *args, **kwargs):
+    # NOTE: Upper bound of the requests sent to a single API server at once. It is independent of max_workers:
+    # the executor (32 threads by default) is shared by all the clusters, and with several namespaces a cluster
+    # sends 6 list requests per namespace, so without this limit one cluster could take every worker and flood
+    # its API server with all of them. With max_workers at or below this value the executor is the tighter bound
+    MAX_CONCURRENT_API_CALLS = 20
+
+    def __init__(self, cluster: Optional[str], executor: ThreadPoolExecutor, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.cluster = cluster
-        self.api_client = config.new_client_from_config(context=cluster) if cluster is not None else None
+        # NOTE: The kubernetes client is blocking, so the requests are run in a dedicated executor
+        # sized by the config, instead of competing for the default asyncio one
+        self.executor = executor
+        self._api_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_API_CALLS)
+
+    async def connect(self) -> None:
+        """Create the API clients for the cluster.
+
+        Loading the kubeconfig might run an exec credential plugin (e.g. gcloud or aws-iam-authenticator),
+        which can take seconds, so it is done in a thread to let the clusters connect concurrently.
+        """
+
+        self.api_client = await asyncio.to_thread(get_api_client, self.cluster, pool_maxsize=self.config.max_workers)
         self.apps = client.AppsV1Api(api_client=self.api_client)
         self.batch = client.BatchV1Api(api_client=self.api_client)
         self.core = client.CoreV1Api(api_client=self.api_client)
@@ -42,132 +128,173 @@ class ClusterLoader(Configurable):
         self.debug(f"Namespaces: {self.config.namespaces}")
 
         try:
-            objects_tuple = await asyncio.gather(
+            pods_by_owner, deployments, statefulsets, daemonsets, jobs = await asyncio.gather(
+                self._list_pods_by_owner(),
                 self._list_deployments(),
                 self._list_all_statefulsets(),
                 self._list_all_daemon_set(),
                 self._list_all_jobs(),
             )
+
+            # NOTE: All the API calls are done at this point, so the objects are built in a single pass.
+            # The items are already filtered by namespace, so we do not build objects that would be discarded
+            workloads = [
+                ("Deployment", deployments),
+                ("StatefulSet", statefulsets),
+                ("DaemonSet", daemonsets),
+                ("Job", jobs),
+            ]
+            return [
+                self.__build_obj(item, container, kind, pods_by_owner.get(item.metadata.uid, []))
+                for kind, items in workloads
+                for item in items
+                for container in item.spec.template.spec.containers
+            ]
         except Exception as e:
             self.error(f"Error trying to list pods in cluster {self.cluster}: {e}")
             self.debug_exception()
             return []
 
+    def _filter_namespaces(self, items: list[_ItemT]) -> list[_ItemT]:
+        # NOTE: The API requests are already filtered by namespace, this is only a fallback
+        # in case an item from another namespace gets through. The mode is checked once per list, not per item
         if self.config.namespaces == "*":
             # NOTE: We are not scanning kube-system namespace by default
-            return [obj for obj in itertools.chain(*objects_tuple) if obj.namespace != "kube-system"]
-        else:
-            return [obj for obj in itertools.chain(*objects_tuple) if obj.namespace in self.config.namespaces]
+            return [item for item in items if item.metadata.namespace != "kube-system"]
 
-    @staticmethod
-    def _get_match_expression_filter(expression) -> str:
-        if expression.operator.lower() == "exists":
-            return expression.key
-        elif expression.operator.lower() == "doesnotexist":
-            return f"!{expression.key}"
+        namespaces = frozenset(self.config.namespaces)
+        return [item for item in items if item.metadata.namespace in namespaces]
 
-        values = ",".join(expression.values)
-        return f"{expression.key} {expression.operator} ({values})"
+    async def _run_api_call(self, method: Callable[..., _T], **kwargs: Any) -> _T:
+        loop = asyncio.get_running_loop()
+        async with self._api_semaphore:
+            return await loop.run_in_executor(self.executor, functools.partial(method, **kwargs))
 
-    @staticmethod
-    def _build_selector_query(selector: V1LabelSelector) -> Union[str, None]:
-        label_filters = [f"{label[0]}={label[1]}" for label in selector.match_labels.items()]
+    async def _list_all(
+        self, list_for_all_namespaces: Callable[..., Any], list_namespaced: Callable[..., Any]
+    ) -> list[Any]:
+        """List the items of a resource in the configured namespaces, filtering them on the API server side.
 
-        if selector.match_expressions is not None:
-            label_filters.extend(
-                [ClusterLoader._get_match_expression_filter(expression) for expression in selector.match_expressions]
-            )
+        Args:
+            list_for_all_namespaces: The API method listing the resource in all namespaces.
+            list_namespaced: The API method listing the resource in a single namespace.
 
-        return ",".join(label_filters)
+        Returns:
+            A list of the items.
+        """
 
-    async def __list_pods(self, resource: Union[V1Deployment, V1DaemonSet, V1StatefulSet]) -> list[str]:
-        selector = self._build_selector_query(resource.spec.selector)
-        if selector is None:
-            return []
+        # NOTE: resource_version="0" lets the API server answer from its watch cache instead of reading etcd.
+        # The result might be slightly stale, which does not matter for the recommendations
+        kwargs = {"watch": False, "resource_version": "0"}
 
-        ret: V1PodList = await asyncio.to_thread(
-            self.core.list_namespaced_pod, namespace=resource.metadata.namespace, label_selector=selector
+        if self.config.namespaces == "*":
+            # NOTE: We are not scanning kube-system namespace by default, so it is not even fetched
+            ret = await self._run_api_call(
+                list_for_all_namespaces, field_selector="metadata.namespace!=kube-system", **kwargs
+            )
+            return self._filter_namespaces(ret.items)
+
+        # NOTE: Each namespace is listed separately, so only a permission in those namespaces is required
+        rets = await asyncio.gather(
+            *[self._run_api_call(list_namespaced, namespace=namespace, **kwargs) for namespace in self.config.namespaces]
         )
-        return [pod.metadata.name for pod in ret.items]
+        return self._filter_namespaces([item for ret in rets for item in ret.items])
+
+    async def _list_pods_by_owner(self) -> dict[str, list[str]]:
+        """List all pods in the cluster once and index their names by the uid of the owning workload.
 
-    async def __build_obj(
-        self, item: Union[V1Deployment, V1DaemonSet, V1StatefulSet], container: V1Container
+        Returns:
+            A mapping from the owner uid to the names of the pods it manages.
+        """
+
+        pods, replica_sets = await asyncio.gather(self._list_pods(), self._list_replica_sets())
+
+        pods_by_owner: defaultdict[str, list[str]] = defaultdict(list)
+        for pod in pods:
+            for owner in pod.metadata.owner_references or []:
+                pods_by_owner[owner.uid].append(pod.metadata.name)
+
+        # NOTE: Deployment pods are owned by its ReplicaSets, so we attribute them to the Deployment itself
+        for replica_set in replica_sets:
+            for owner in replica_set.metadata.owner_references or []:
+                pods_by_owner[owner.uid].extend(pods_by_owner.get(replica_set.metadata.uid, []))
+
+        return pods_by_owner
+
+    def __build_obj(
+        self,
+        item: Union[V1Deployment, V1DaemonSet, V1StatefulSet, V1Job],
+        container: V1Container,
+        kind: str,
+        pods: list[str],
     ) -> K8sObjectData:
         return K8sObjectData(
             cluster=self.cluster,
             namespace=item.metadata.namespace,
             name=item.metadata.name,
-            kind=item.__class__.__name__[2:],
+            kind=kind,
             container=container.name,
             allocations=ResourceAllocations.from_container(container),
-            pods=await self.__list_pods(item),
+            pods=pods,
         )
 
-    async def _list_deployments(self) -> list[K8sObjectData]:
+    async def _list_deployments(self) -> list[V1Deployment]:
         self.debug(f"Listing deployments in {self.cluster}")
-        ret: V1DeploymentList = await asyncio.to_thread(self.apps.list_deployment_for_all_namespaces, watch=False)
-        self.debug(f"Found {len(ret.items)} deployments in {self.cluster}")
-
-        return await asyncio.gather(
-            *[
-                self.__build_obj(item, container)
-                for item in ret.items
-                for container in item.spec.template.spec.containers
-            ]
+        items: list[V1Deployment] = await self._list_all(
+            self.apps.list_deployment_for_all_namespaces, self.apps.list_namespaced_deployment
         )
+        self.debug(f"Found {len(items)} deployments in {self.cluster}")
+        return items
 
-    async def _list_all_statefulsets(self) -> list[K8sObjectData]:
+    async def _list_all_statefulsets(self) -> list[V1StatefulSet]:
         self.debug(f"Listing statefulsets in {self.cluster}")
-        ret: V1StatefulSetList = await asyncio.to_thread(self.apps.list_stateful_set_for_all_namespaces, watch=False)
-        self.debug(f"Found {len(ret.items)} statefulsets in {self.cluster}")
-
-        return await asyncio.gather(
-            *[
-                self.__build_obj(item, container)
-                for item in ret.items
-                for container in item.spec.template.spec.containers
-            ]
+        items: list[V1StatefulSet] = await self._list_all(
+            self.apps.list_stateful_set_for_all_namespaces, self.apps.list_namespaced_stateful_set
         )
+        self.debug(f"Found {len(items)} statefulsets in {self.cluster}")
+        return items
 
-    async def _list_all_daemon_set(self) -> list[K8sObjectData]:
+    async def _list_all_daemon_set(self) -> list[V1DaemonSet]:
         self.debug(f"Listing daemonsets in {self.cluster}")
-        ret: V1DaemonSetList = await asyncio.to_thread(self.apps.list_daemon_set_for_all_namespaces, watch=False)
-        self.debug(f"Found {len(ret.items)} daemonsets in {self.cluster}")
-
-        return await asyncio.gather(
-            *[
-                self.__build_obj(item, container)
-                for item in ret.items
-                for container in item.spec.template.spec.containers
-            ]
+        items: list[V1DaemonSet] = await self._list_all(
+            self.apps.list_daemon_set_for_all_namespaces, self.apps.list_namespaced_daemon_set
         )
+        self.debug(f"Found {len(items)} daemonsets in {self.cluster}")
+        return items
 
-    async def _list_all_jobs(self) -> list[K8sObjectData]:
+    async def _list_all_jobs(self) -> list[V1Job]:
         self.debug(f"Listing jobs in {self.cluster}")
-        ret: V1JobList = await asyncio.to_thread(self.batch.list_job_for_all_namespaces, watch=False)
-        self.debug(f"Found {len(ret.items)} jobs in {self.cluster}")
-
-        return await asyncio.gather(
-            *[
-                self.__build_obj(item, container)
-                for item in ret.items
-                for container in item.spec.template.spec.containers
-            ]
+        items: list[V1Job] = await self._list_all(
+            self.batch.list_job_for_all_namespaces, self.batch.list_namespaced_job
         )
+        self.debug(f"Found {len(items)} jobs in {self.cluster}")
+        return items
 
-    async def _list_pods(self) -> list[K8sObjectData]:
-        """For future use, not supported yet."""
+    async def _list_replica_sets(self) -> list[V1ReplicaSet]:
+        self.debug(f"Listing replicasets in {self.cluster}")
+        items: list[V1ReplicaSet] = await self._list_all(
+            self.apps.list_replica_set_for_all_namespaces, self.apps.list_namespaced_replica_set
+        )
+        self.debug(f"Found {len(items)} replicasets in {self.cluster}")
+        return items
 
+    async def _list_pods(self) -> list[V1Pod]:
         self.debug(f"Listing pods in {self.cluster}")
-        ret: V1PodList = await asyncio.to_thread(self.apps.list_pod_for_all_namespaces, watch=False)
-        self.debug(f"Found {len(ret.items)} pods in {self.cluster}")
-
-        return await asyncio.gather(
-            *[self.__build_obj(item, container) for item in ret.items for container in item.spec.containers]
-        )
+        items: list[V1Pod] = await self._list_all(self.core.list_pod_for_all_namespaces, self.core.list_namespaced_pod)
+        self.debug(f"Found {len(items)} pods in {self.cluster}")
+        return items
 
 
 class KubernetesLoader(Configurable):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.executor = ThreadPoolExecutor(self.config.max_workers)
+
+    def shutdown(self) -> None:
+        """Shut down the executor used for the kubernetes API requests."""
+
+        self.executor.shutdown()
+
     async def list_clusters(self) -> Optional[list[str]]:
         """List all clusters.
 
@@ -204,9 +331,12 @@ class KubernetesLoader(Configurable):
         """
 
         if clusters is None:
-            cluster_loaders = [ClusterLoader(cluster=None, config=self.config)]
+            cluster_loaders = [ClusterLoader(cluster=None, executor=self.executor, config=self.config)]
         else:
-            cluster_loaders = [ClusterLoader(cluster=cluster, config=self.config) for cluster in clusters]
+            cluster_loaders = [
+                ClusterLoader(cluster=cluster, executor=self.executor, config=self.config) for cluster in clusters
+            ]
 
+        await asyncio.gather(*[cluster_loader.connect() for cluster_loader in cluster_loaders])
         objects = await asyncio.gather(*[cluster_loader.list_scannable_objects() for cluster_loader in cluster_loaders])
         return list(itertools.chain(*objects))
@@ -4,13 +4,13 @@ from decimal import Decimal
 from typing import Optional, no_type_check
 
 import requests
-from kubernetes import config as k8s_config
 from kubernetes.client import ApiClient
 from prometheus_api_client import PrometheusConnect, Retry
 from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError, HTTPError
 
 from robusta_krr.core.abstract.strategies import ResourceHistoryData
+from robusta_krr.core.integrations.kubernetes import get_api_client
 from robusta_krr.core.models.config import Config
 from robusta_krr.core.models.objects import K8sObjectData
 from robusta_krr.core.models.result import ResourceType
@@ -67,7 +67,7 @@ class PrometheusLoader(Configurable):
         self.auth_header = self.config.prometheus_auth_header
         self.ssl_enabled = self.config.prometheus_ssl_enabled
 
-        self.api_client = k8s_config.new_client_from_config(context=cluster) if cluster is not None else None
+        self.api_client = get_api_client(cluster, pool_maxsize=self.config.max_workers) if cluster is not None else None
         self.prometheus_discovery = PrometheusDiscovery(config=self.config)
 
         self.url = self.config.prometheus_url
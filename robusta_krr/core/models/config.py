@@ -31,6 +31,10 @@ class Config(pd.BaseSettings):
     prometheus_auth_header: Optional[str] = pd.Field(None)
     prometheus_ssl_enabled: bool = pd.Field(False)
 
+    # Threading settings
+    # NOTE: Matches the upper bound of the default asyncio executor, as those threads only wait on the network
+    max_workers: int = pd.Field(32, ge=1)
+
     # Logging Settings
     format: str
     strategy: str
@@ -4,7 +4,7 @@ from decimal import Decimal
 from typing import Optional, Union
 
 from robusta_krr.core.abstract.strategies import ResourceRecommendation, RunResult
-from robusta_krr.core.integrations.kubernetes import KubernetesLoader
+from robusta_krr.core.integrations.kubernetes import KubernetesLoader, close_api_clients
 from robusta_krr.core.integrations.prometheus import PrometheusLoader
 from robusta_krr.core.models.config import Config
 from robusta_krr.core.models.objects import K8sObjectData
@@ -133,5 +133,9 @@ class Runner(Configurable):
 
     async def run(self) -> None:
         self._greet()
-        result = await self._collect_result()
+        try:
+            result = await self._collect_result()
+        finally:
+            self._k8s_loader.shutdown()
+            close_api_clients()
         self._process_result(result)
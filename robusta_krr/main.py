@@ -76,6 +76,13 @@ def load_commands() -> None:
                     help="Enable SSL for Prometheus requests.",
                     rich_help_panel="Prometheus Settings",
                 ),
+                max_workers: int = typer.Option(
+                    32,
+                    "--max-workers",
+                    "-w",
+                    help="Max threads to use for the blocking kubernetes API requests.",
+                    rich_help_panel="Threading Settings",
+                ),
                 format: str = typer.Option("table", "--formatter", "-f", help="Output formatter ({formatters})", rich_help_panel="Logging Settings"),
                 verbose: bool = typer.Option(False, "--verbose", "-v", help="Enable verbose mode", rich_help_panel="Logging Settings"),
                 quiet: bool = typer.Option(False, "--quiet", "-q", help="Enable quiet mode", rich_help_panel="Logging Settings"),
@@ -90,6 +97,7 @@ def load_commands() -> None:
                     prometheus_url=prometheus_url,
                     prometheus_auth_header=prometheus_auth_header,
                     prometheus_ssl_enabled=prometheus_ssl_enabled,
+                    max_workers=max_workers,
                     format=format,
                     verbose=verbose,
                     quiet=quiet,
@@ -134,7 +142,23 @@ def load_commands() -> None:
         )
 
 
+def __install_event_loop() -> None:
+    """Use uvloop as the asyncio event loop if it is installed, as it has less overhead per task.
+
+    uvloop is not a dependency of krr, so the Docker image and the pyinstaller binary use the default loop.
+    Install it manually (pip install uvloop) to enable it.
+    """
+
+    try:
+        import uvloop  # type: ignore
+    except ImportError:
+        return
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
 def run() -> None:
+    __install_event_loop()
     load_commands()
     app()
 
@@ -0,0 +1,156 @@
+"""
+    Test the matching of pods to their workloads in the kubernetes loader.
+    The kubernetes API is mocked, so no cluster access is needed.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+from unittest.mock import MagicMock
+
+import pytest
+from kubernetes.client.models import (
+    V1Container,
+    V1DaemonSet,
+    V1DaemonSetList,
+    V1DaemonSetSpec,
+    V1Deployment,
+    V1DeploymentList,
+    V1DeploymentSpec,
+    V1Job,
+    V1JobList,
+    V1JobSpec,
+    V1LabelSelector,
+    V1ObjectMeta,
+    V1OwnerReference,
+    V1Pod,
+    V1PodList,
+    V1PodSpec,
+    V1PodTemplateSpec,
+    V1ReplicaSet,
+    V1ReplicaSetList,
+    V1StatefulSet,
+    V1StatefulSetList,
+    V1StatefulSetSpec,
+)
+
+from robusta_krr.core.integrations.kubernetes import ClusterLoader
+from robusta_krr.core.models.config import Config
+
+
+def _meta(namespace: str, name: str, uid: str, owner: Optional[tuple[str, str, str]] = None) -> V1ObjectMeta:
+    owner_references = None
+    if owner is not None:
+        kind, owner_name, owner_uid = owner
+        owner_references = [V1OwnerReference(api_version="v1", kind=kind, name=owner_name, uid=owner_uid)]
+
+    return V1ObjectMeta(namespace=namespace, name=name, uid=uid, owner_references=owner_references)
+
+
+def _template() -> V1PodTemplateSpec:
+    return V1PodTemplateSpec(spec=V1PodSpec(containers=[V1Container(name="main")]))
+
+
+def _pod(namespace: str, name: str, uid: str, owner: Optional[tuple[str, str, str]] = None) -> V1Pod:
+    return V1Pod(metadata=_meta(namespace, name, uid, owner), spec=V1PodSpec(containers=[V1Container(name="main")]))
+
+
+@pytest.fixture
+def cluster_loader() -> Iterator[ClusterLoader]:
+    config = Config(format="table", strategy="simple", log_to_stderr=True, other_args={}, quiet=True)
+    executor = ThreadPoolExecutor(1)
+    loader = ClusterLoader(cluster=None, executor=executor, config=config)
+    loader.apps, loader.batch, loader.core = MagicMock(), MagicMock(), MagicMock()
+
+    selector = V1LabelSelector(match_labels={"app": "test"})
+    loader.apps.list_deployment_for_all_namespaces.return_value = V1DeploymentList(
+        items=[
+            V1Deployment(
+                metadata=_meta("default", "web", "deployment-uid"),
+                spec=V1DeploymentSpec(selector=selector, template=_template()),
+            )
+        ]
+    )
+    loader.apps.list_replica_set_for_all_namespaces.return_value = V1ReplicaSetList(
+        items=[
+            V1ReplicaSet(metadata=_meta("default", "web-1", "rs-1-uid", ("Deployment", "web", "deployment-uid"))),
+            V1ReplicaSet(metadata=_meta("default", "web-2", "rs-2-uid", ("Deployment", "web", "deployment-uid"))),
+        ]
+    )
+    loader.apps.list_stateful_set_for_all_namespaces.return_value = V1StatefulSetList(
+        items=[
+            V1StatefulSet(
+                metadata=_meta("default", "db", "statefulset-uid"),
+                spec=V1StatefulSetSpec(selector=selector, service_name="db", template=_template()),
+            )
+        ]
+    )
+    loader.apps.list_daemon_set_for_all_namespaces.return_value = V1DaemonSetList(
+        items=[
+            V1DaemonSet(
+                metadata=_meta("default", "agent", "daemonset-uid"),
+                spec=V1DaemonSetSpec(selector=selector, template=_template()),
+            )
+        ]
+    )
+    loader.batch.list_job_for_all_namespaces.return_value = V1JobList(
+        items=[V1Job(metadata=_meta("default", "migrate", "job-uid"), spec=V1JobSpec(template=_template()))]
+    )
+    loader.core.list_pod_for_all_namespaces.return_value = V1PodList(
+        items=[
+            _pod("default", "web-1-a", "pod-1", ("ReplicaSet", "web-1", "rs-1-uid")),
+            _pod("default", "web-2-a", "pod-2", ("ReplicaSet", "web-2", "rs-2-uid")),
+            _pod("default", "db-0", "pod-3", ("StatefulSet", "db", "statefulset-uid")),
+            _pod("default", "agent-a", "pod-4", ("DaemonSet", "agent", "daemonset-uid")),
+            _pod("default", "migrate-a", "pod-5", ("Job", "migrate", "job-uid")),
+            _pod("default", "standalone", "pod-6"),
+        ]
+    )
+
+    yield loader
+    executor.shutdown()
+
+
+def test_pods_matched_by_owner(cluster_loader: ClusterLoader):
+    objects = asyncio.run(cluster_loader.list_scannable_objects())
+    pods = {(obj.kind, obj.name): sorted(obj.pods) for obj in objects}
+
+    assert pods == {
+        ("Deployment", "web"): ["web-1-a", "web-2-a"],
+        ("StatefulSet", "db"): ["db-0"],
+        ("DaemonSet", "agent"): ["agent-a"],
+        ("Job", "migrate"): ["migrate-a"],
+    }
+
+
+def test_pods_without_owner_are_ignored(cluster_loader: ClusterLoader):
+    pods_by_owner = asyncio.run(cluster_loader._list_pods_by_owner())
+
+    assert all("standalone" not in pods for pods in pods_by_owner.values())
+
+
+def test_single_namespace_listed_namespaced(cluster_loader: ClusterLoader):
+    cluster_loader.config.namespaces = ["default"]
+    deployments = cluster_loader.apps.list_deployment_for_all_namespaces.return_value
+    cluster_loader.apps.list_namespaced_deployment.return_value = deployments
+
+    items = asyncio.run(cluster_loader._list_deployments())
+
+    assert cluster_loader.apps.list_namespaced_deployment.call_args.kwargs["namespace"] == "default"
+    assert [item.metadata.name for item in items] == ["web"]
+    cluster_loader.apps.list_deployment_for_all_namespaces.assert_not_called()
+
+
+def test_multiple_namespaces_listed_separately(cluster_loader: ClusterLoader):
+    cluster_loader.config.namespaces = ["default", "other"]
+    deployments = cluster_loader.apps.list_deployment_for_all_namespaces.return_value
+    cluster_loader.apps.list_namespaced_deployment.side_effect = lambda namespace, **kwargs: (
+        deployments if namespace == "default" else V1DeploymentList(items=[])
+    )
+
+    items = asyncio.run(cluster_loader._list_deployments())
+
+    namespaces = [call.kwargs["namespace"] for call in cluster_loader.apps.list_namespaced_deployment.call_args_list]
+    assert [item.metadata.name for item in items] == ["web"]
+    assert sorted(namespaces) == ["default", "other"]
+    cluster_loader.apps.list_deployment_for_all_namespaces.assert_not_called()